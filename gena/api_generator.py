@@ -1,14 +1,173 @@
+import dataclasses
+import decimal
+import operator
+import sqlite3
+import uuid
 from collections import defaultdict
 from curses import raw
-import re
-from functools import partial
-from typing import Mapping, Type, Callable, Any, List, Optional, Dict
-
-from flask import Blueprint, json, request, jsonify
-from gena.deserializer import generate_deserializer
-from peewee import Model as PeeweeModel, DoesNotExist, fn
-from playhouse.shortcuts import model_to_dict
+from datetime import date, datetime, time
+from functools import lru_cache
+from typing import (
+    Mapping,
+    Tuple,
+    Type,
+    Callable,
+    Any,
+    List,
+    Optional,
+    Dict,
+    get_args,
+)
+
+import orjson
+from flask import Blueprint, Response, request, stream_with_context
+from gena.cache import TTLCache
+from gena.deserializer import (
+    deserialize_bool,
+    deserialize_float,
+    deserialize_int,
+    deserialize_optional_bool,
+    deserialize_optional_float,
+    deserialize_optional_int,
+    deserialize_optional_str,
+    deserialize_str,
+    generate_deserializer,
+    get_cached_type_hints,
+    get_record_deserializer,
+)
+from peewee import (
+    SQL,
+    DatabaseProxy,
+    DoesNotExist,
+    Model as PeeweeModel,
+    MySQLDatabase,
+    PostgresqlDatabase,
+    SqliteDatabase,
+    fn,
+)
 from werkzeug.exceptions import BadRequest, NotFound
+from werkzeug.http import http_date
+
+
+# mapping from the comparison operators in the query to functions building the condition
+OP_DISPATCH = {
+    None: operator.eq,
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+}
+
+
+def parse_bool_str(value: str) -> bool:
+    if value == "true":
+        return True
+    if value == "false":
+        return False
+    raise ValueError(f"expect bool string but get: {value}")
+
+
+# functions that are equivalent to the deserializers when the value is a string, the builtin
+# functions parse the values in C without the type checks of the deserializers
+STR_DESERIALIZERS = {
+    deserialize_int: int,
+    deserialize_float: float,
+    deserialize_str: str,
+    deserialize_bool: parse_bool_str,
+    deserialize_optional_int: int,
+    deserialize_optional_float: float,
+    deserialize_optional_str: str,
+    deserialize_optional_bool: parse_bool_str,
+}
+
+
+def parse_non_negative_int(args, name: str, default: int) -> int:
+    """Parse an optional non-negative integer argument of a query"""
+    if name not in args:
+        return default
+    value = args[name]
+    if not (value.isascii() and value.isdigit()):
+        raise BadRequest(
+            f"Invalid {name}: expect a non-negative integer but get {value}"
+        )
+    return int(value)
+
+
+# name of the column storing the total number of records computed by a window function
+WINDOW_TOTAL_ALIAS = "gena_window_total"
+
+
+def support_window_function(database) -> bool:
+    """Check if the database supports window functions, e.g., `COUNT(*) OVER ()`"""
+    if isinstance(database, DatabaseProxy):
+        database = database.obj
+    if isinstance(database, PostgresqlDatabase):
+        return True
+    if isinstance(database, SqliteDatabase):
+        return sqlite3.sqlite_version_info >= (3, 25, 0)
+    if isinstance(database, MySQLDatabase):
+        # the server version is only known once connected. MySQL supports window functions
+        # from 8.0 and MariaDB from 10.2, a 10.x server is MariaDB as MySQL has no 10.x
+        server_version = getattr(database, "server_version", None)
+        if server_version is None:
+            return False
+        if getattr(database, "mariadb", False) or server_version >= (10,):
+            return server_version >= (10, 2)
+        return server_version >= (8, 0)
+    return False
+
+
+def json_default(obj):
+    """Serialize objects that orjson does not handle the same way as Flask's JSON encoder"""
+    if isinstance(obj, date):
+        return http_date(obj)
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if dataclasses.is_dataclass(obj):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, "__html__"):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+# types whose values are encoded by json_default, which orjson encodes differently (or not at all)
+# when it encodes them natively, e.g., in the stored JSON of the custom fields
+JSON_DEFAULT_TYPES = (date, time, decimal.Decimal)
+
+
+def has_json_default_values(annotated_type, visited: Optional[set] = None) -> bool:
+    """Check if values of the type may contain values encoded by json_default"""
+    if isinstance(annotated_type, type):
+        if issubclass(annotated_type, JSON_DEFAULT_TYPES):
+            return True
+        if dataclasses.is_dataclass(annotated_type) or (
+            issubclass(annotated_type, dict) and hasattr(annotated_type, "__total__")
+        ):
+            # dataclasses and typed dicts, which may be recursive
+            visited = visited if visited is not None else set()
+            if annotated_type in visited:
+                return False
+            visited.add(annotated_type)
+            return any(
+                has_json_default_values(field_type, visited)
+                for field_type in get_cached_type_hints(annotated_type).values()
+            )
+    return any(
+        has_json_default_values(arg, visited) for arg in get_args(annotated_type)
+    )
+
+
+def dumps_json(obj) -> bytes:
+    return orjson.dumps(
+        obj,
+        default=json_default,
+        option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+    )
+
+
+def json_response(obj) -> Response:
+    """Create a JSON response using orjson, a faster replacement of flask.jsonify"""
+    return Response(dumps_json(obj), mimetype="application/json")
 
 
 def generate_api(
@@ -17,6 +176,7 @@ def generate_api(
     serialize: Optional[Callable[[Any], dict]] = None,
     batch_serialize: Optional[Callable[[List[Any]], List[dict]]] = None,
     enable_truncate_table: bool = False,
+    cache_ttl: Optional[float] = None,
 ):
     """Generate API from the given Model
 
@@ -26,12 +186,17 @@ def generate_api(
         serialize:
         batch_serialize:
         enable_truncate_table: whether to enable API to truncate the whole table
+        cache_ttl: if provided, responses of the API listing records are cached in memory for this number of seconds (identical concurrent queries share one execution). The cache is cleared when records are modified through this API, but not when the table is modified elsewhere
     """
     table_name = Model._meta.table_name
-    default_limit = str(50)
-    name2field = {name: field for name, field in Model._meta.fields.items()}
-    op_fields = {"fields", "limit", "offset", "unique", "sorted_by", "group_by"}
-    field_reg = re.compile(r"(?P<name>[a-zA-Z_0-9]+)(?:\[(?P<op>[a-zA-Z0-9]+)\])?")
+    default_limit = 50
+    name2field = {field.name: field for field in Model._meta.sorted_fields}
+    # `count` is common as a column name, so it is only an option when it is not a field
+    count_is_op = "count" not in name2field
+    op_fields = frozenset(
+        ["fields", "limit", "offset", "unique", "sorted_by", "group_by"]
+        + (["count"] if count_is_op else [])
+    )
 
     if deserializers is None:
         deserializers = generate_deserializer(Model)
@@ -44,23 +209,113 @@ def generate_api(
             f"Table {table_name} doesn't have deserializer for field: {set(name2field.keys()).difference(deserializers.keys())}"
         )
 
+    # when the records are serialized by the default serializer, we read them directly as
+    # dictionaries from the database cursor instead of creating model instances
+    read_dicts = (
+        serialize is None and batch_serialize is None and not hasattr(Model, "to_dict")
+    )
+
     if serialize is None:
         if hasattr(Model, "to_dict"):
             serialize = Model.to_dict
         elif batch_serialize is not None:
             serialize = lambda x: batch_serialize([x])[0]
         else:
-            serialize = partial(model_to_dict, recurse=False)
+            serialize = gen_model_serializer(Model)
+
+    # records read as dictionaries are streamed to the client as they are read. other serializers
+    # may fail at any record, so their responses are built fully to report the errors properly
+    stream_records = read_dicts
 
     if batch_serialize is None:
         assert serialize is not None
-        batch_serialize = lambda lst: [serialize(item) for item in lst]
+        batch_serialize = gen_batch_serialize(serialize)
+    else:
+        batch_serialize = gen_projected_batch_serialize(batch_serialize)
 
     assert len(op_fields.intersection(name2field.keys())) == 0
 
+    # field, its deserializer, and the function to parse its values in a query string (filters)
+    # indexed by the field's name so that the filter parser needs only one lookup
+    name2field_deser = {
+        name: (
+            field,
+            deserializers[name],
+            STR_DESERIALIZERS.get(deserializers[name], deserializers[name]),
+        )
+        for name, field in name2field.items()
+    }
+
+    # deserialize the fields of a posted record with code specialized for this model
+    deserialize_record = get_record_deserializer(
+        {name: deser for name, (_, deser, _) in name2field_deser.items()}
+    )
+
+    # query selecting all columns of the table, prepared once and cloned in the handlers
+    select_all = Model.select()
+
+    # fields whose stored JSON is sent to clients as it is when records are read as dictionaries,
+    # they are selected without converting their values to python objects
+    raw_json_names = (
+        [
+            name
+            for name, field in name2field.items()
+            if getattr(field, "raw_json", False)
+        ]
+        if read_dicts
+        else []
+    )
+    for field in name2field.values():
+        if getattr(field, "raw_json", False) and has_json_default_values(field.CLS):
+            # the stored JSON would be sent with different formats than the other endpoints
+            raise ValueError(
+                f"Field {field.name} cannot use `raw_json` as {field.CLS.__name__} contains values (e.g., dates or decimals) that are not stored as they are sent"
+            )
+    if len(raw_json_names) > 0:
+        select_list = Model.select(
+            *[
+                field.coerce(False) if field.name in raw_json_names else field
+                for field in Model._meta.sorted_fields
+            ]
+        )
+        dumps_item = gen_dumps_with_raw_json(raw_json_names, list(name2field.keys()))
+    else:
+        select_list = select_all
+        dumps_item = dumps_json
+
+    def parse_fields(args) -> Tuple[List[str], list]:
+        """Parse the `fields` argument into the names and the columns to select"""
+        if "fields" not in args:
+            return [], []
+        field_names = args["fields"].split(",")
+        invalid_names = set(field_names).difference(name2field.keys())
+        if len(invalid_names) > 0:
+            raise BadRequest(f"Invalid field name: {', '.join(invalid_names)}")
+        return field_names, [name2field[name] for name in field_names]
+
+    def parse_record(record: dict) -> dict:
+        """Deserialize the fields of a posted record, invalid values are bad requests"""
+        try:
+            return deserialize_record(record)
+        except ValueError as e:
+            raise BadRequest(str(e))
+
+    # parse an id given in the url with the parser of the primary key, models may not have a field
+    # named `id` (or a single primary key) so the ids are kept as strings then
+    primary_key = Model._meta.primary_key
+    if primary_key and primary_key.name in name2field_deser:
+        parse_id = name2field_deser[primary_key.name][2]
+    else:
+        parse_id = str
+
+    list_cache = TTLCache(cache_ttl) if cache_ttl is not None else None
+
+    def invalidate_cache():
+        if list_cache is not None:
+            list_cache.clear()
+
     bp = Blueprint(table_name, table_name)
 
-    @bp.route(f"/{table_name}", methods=["GET"])
     def get():
         """Retrieving records matched a query.
         Condition on a field such as >, >=, <, <=, `max`, `min`, `in` can be specified using brackets such as: <field>[gt]=10.
@@ -72,99 +327,112 @@ def generate_api(
         We can support another aggregation to select keep all values in a group. However, since each value is for each record, we also have multiple ids. Therefore, a natural choice is to use `group_by` operator instead. Note that when you use group_by, the output is still a table (not a mapping) so that the client can reuse the code that read the data, but they have to group the result themselves.
 
         Note that we enforce the constraint that only one aggregation (`max`, `min`, `group_by`, etc) is allow in a query to ensure the behaviour of the query is deterministic (e.g., apply a group_by and max, which one is apply first?).
+
+        The total number of matched records is returned along with the items. It is only counted by a separated query when the returned page is full, and can be skipped entirely with `count=false` (total is null then). The option is not available when the model has a field named `count`, which is filtered as other fields.
         """
-        if "fields" in request.args:
-            field_names = request.args["fields"].split(",")
-            fields = [name2field[name] for name in field_names]
-        else:
-            field_names = []
-            fields = []
+        args = request.args
+        field_names, fields = parse_fields(args)
 
-        limit = int(request.args.get("limit", default_limit))
-        offset = int(request.args.get("offset", "0"))
+        limit = parse_non_negative_int(args, "limit", default_limit)
+        offset = parse_non_negative_int(args, "offset", 0)
 
         # construct select clause
-        query = Model.select(*fields)
-        unique = request.args.get("unique", "false") == "true"
+        if len(fields) == 0:
+            query = select_list.clone()
+            dumps_record = dumps_item
+        elif any(name in raw_json_names for name in field_names):
+            query = Model.select(
+                *[
+                    field.coerce(False) if field.name in raw_json_names else field
+                    for field in fields
+                ]
+            )
+            dumps_record = gen_dumps_with_raw_json(raw_json_names, field_names)
+        else:
+            query = Model.select(*fields)
+            dumps_record = dumps_json
+        unique = args.get("unique", "false") == "true"
+        with_count = not count_is_op or args.get("count", "true") != "false"
         if unique:
             query = query.distinct()
 
         # construct order by clause
-        order_by = []
-        if "sorted_by" in request.args:
-            for field in request.args["sorted_by"].split(","):
-                try:
-                    if field.startswith("-"):
-                        field = field[1:]
-                        order_by.append(name2field[field].desc())
-                    else:
-                        order_by.append(name2field[field])
-                except KeyError:
-                    raise BadRequest(f"Invalid field name: {field}")
-
-        if len(order_by) > 0:
+        if "sorted_by" in args:
+            sorted_by = args["sorted_by"].split(",")
+            order_by_names = [
+                field[1:] if field.startswith("-") else field for field in sorted_by
+            ]
+            invalid_names = set(order_by_names).difference(name2field.keys())
+            if len(invalid_names) > 0:
+                raise BadRequest(f"Invalid field name: {', '.join(invalid_names)}")
+            order_by = [
+                name2field[name].desc() if field.startswith("-") else name2field[name]
+                for field, name in zip(sorted_by, order_by_names)
+            ]
             query = query.order_by(*order_by)
+        else:
+            order_by = []
+            order_by_names = []
 
         # construct group by clause
-        group_by = []
-        if "group_by" in request.args:
-            for field in request.args["group_by"].split(","):
-                if field not in name2field:
-                    raise BadRequest(f"Invalid field name: {field}")
-                group_by.append(name2field[field])
+        if "group_by" in args:
+            group_by_names = args["group_by"].split(",")
+            invalid_names = set(group_by_names).difference(name2field.keys())
+            if len(invalid_names) > 0:
+                raise BadRequest(f"Invalid field name: {', '.join(invalid_names)}")
+            group_by = [name2field[name] for name in group_by_names]
+        else:
+            group_by = []
 
         # construct where clause
-        filter_fields = defaultdict(list)
-        for name, value in request.args.items():
+        # parse and apply the filters in one pass, the containers are only created when the query
+        # has filters
+        pending_ops = None
+        conditions = None
+        for name, value in args.items():
             if name in op_fields:
                 continue
-            m = field_reg.match(name)
-            if m is None:
+            # the key is either `<field>` or `<field>[<op>]`
+            name, sep, op = name.partition("[")
+            if sep:
+                # the whole key must match, e.g., `field[]` or `field[gt]x` are invalid
+                if len(op) < 2 or not op.endswith("]"):
+                    raise BadRequest(f"Invalid field name: {name}{sep}{op}")
+                op = op[:-1]
+            else:
+                op = None
+
+            if name not in name2field_deser:
                 raise BadRequest(f"Invalid field name: {name}")
+            field, _, str_deser = name2field_deser[name]
 
-            name = m.group("name")
-            if name not in name2field:
-                raise BadRequest(f"Invalid field name: {name}")
+            if conditions is None:
+                pending_ops = defaultdict(dict)
+                conditions = defaultdict(list)
+                condition_list = []
 
-            op = m.group("op")
-            filter_fields[name].append((op, value))
-
-        pending_ops = defaultdict(dict)
-        conditions = defaultdict(list)
-        for name, ops in filter_fields.items():
-            for op, value in ops:
-                field = name2field[name]
-                if op in {"max"}:
-                    assert op not in pending_ops[name]
-                    pending_ops[name][op] = value
-                    continue
-                elif op == "in":
-                    deser = deserializers[name]
-                    conditions[field].append(
-                        (field.in_([deser(x) for x in value.split(",")]))
-                    )
-                    continue
-
-                # no special operator
-                value = deserializers[name](value)
-                if op is None:
-                    conditions[field].append((field == value))
-                elif op == "gt":
-                    conditions[field].append((field > value))
-                elif op == "gte":
-                    conditions[field].append((field >= value))
-                elif op == "lt":
-                    conditions[field].append((field < value))
-                elif op == "lte":
-                    conditions[field].append((field <= value))
+            if op == "max":
+                pending_ops[name][op] = value
+                continue
+            try:
+                if op == "in":
+                    condition = field.in_(tuple(map(str_deser, value.split(","))))
                 else:
-                    raise BadRequest(f"Does not support {op} yet")
-
-        if len(conditions) > 0:
-            query = query.where(*[item for lst in conditions.values() for item in lst])
+                    # no special operator
+                    op_fn = OP_DISPATCH.get(op)
+                    if op_fn is None:
+                        raise BadRequest(f"Does not support {op} yet")
+                    condition = op_fn(field, str_deser(value))
+            except ValueError as e:
+                raise BadRequest(f"Invalid value of field {name}: {str(e)}")
+            conditions[field].append(condition)
+            condition_list.append(condition)
+
+        if conditions is not None and len(condition_list) > 0:
+            query = query.where(*condition_list)
 
         if len(group_by) > 0:
-            if len(pending_ops) > 0:
+            if pending_ops:
                 raise BadRequest(f"Does not support multiple aggregations")
             # update the select to keep the id
             subquery = query.select(
@@ -176,160 +444,355 @@ def generate_api(
                 predicate = predicate & (c == getattr(subquery.c, f"gb_c{i}"))
             query = query.join(subquery.limit(limit).offset(offset), on=predicate)
             # they want to get only one record so we save computation knowing that it won't use anyway
-            total = subquery.count()
+            total = subquery.count() if with_count else None
+            count_query = None
+            is_window_total = False
         else:
-            for name, ops in pending_ops.items():
-                field = name2field[name]
-                for op, value in ops.items():
-                    if op == "max":
-                        # select the record with maximum value in the group
-                        # need to do a subquery to select the one with maximum value
-                        subquery_group_fields = []
-                        subquery_group_field_conditions = []
-
-                        for gfield in value.split(","):
-                            if gfield not in name2field:
-                                raise BadRequest(f"Invalid group by field: {gfield}")
-                            subquery_group_fields.append(name2field[gfield])
-                            if gfield in conditions:
-                                if gfield in pending_ops:
+            total = None
+            is_paginated = False
+            is_window_total = False
+            if pending_ops:
+                for name, ops in pending_ops.items():
+                    field = name2field[name]
+                    for op, value in ops.items():
+                        if op == "max":
+                            # select the record with maximum value in the group
+                            # need to do a subquery to select the one with maximum value
+                            subquery_group_fields = []
+                            subquery_group_field_conditions = []
+
+                            group_names = value.split(",")
+                            for gfield in group_names:
+                                if gfield not in name2field:
                                     raise BadRequest(
-                                        f"Does not support multiple aggregations"
+                                        f"Invalid group by field: {gfield}"
                                     )
-                                subquery_group_field_conditions += conditions[gfield]
-
-                        subquery_name = f"{name}_{op}"
-                        field_alias = f"{subquery_name}_{name}"
-                        subquery = (
-                            Model.select(Model.id, fn.MAX(field).alias(field_alias))
-                            .group_by(*subquery_group_fields)
-                            .alias(subquery_name)
-                        )
-
-                        if len(subquery_group_field_conditions) > 0:
-                            subquery = subquery.where(*subquery_group_field_conditions)
+                                subquery_group_fields.append(name2field[gfield])
+                                if name2field[gfield] in conditions:
+                                    if gfield in pending_ops:
+                                        raise BadRequest(
+                                            f"Does not support multiple aggregations"
+                                        )
+                                    subquery_group_field_conditions += conditions[
+                                        name2field[gfield]
+                                    ]
+
+                            subquery_name = f"{name}_{op}"
+                            field_alias = f"{subquery_name}_{name}"
+                            use_window = support_window_function(Model._meta.database)
+                            if use_window:
+                                # rank the records in each group by the field and keep the first
+                                # one, which scans the table once instead of joining the maximum
+                                # values of the groups back to the table
+                                ranked = Model.select(
+                                    Model.id,
+                                    *subquery_group_fields,
+                                    fn.ROW_NUMBER()
+                                    .over(
+                                        partition_by=subquery_group_fields,
+                                        order_by=[field.desc(), Model.id],
+                                    )
+                                    .alias(field_alias),
+                                ).where(
+                                    # MAX ignores null values
+                                    field.is_null(False),
+                                    *subquery_group_field_conditions,
+                                )
+                                ranked = ranked.alias(f"{subquery_name}_ranked")
+                                subquery = (
+                                    Model.select(ranked.c.id)
+                                    .from_(ranked)
+                                    .where(getattr(ranked.c, field_alias) == 1)
+                                    .alias(subquery_name)
+                                )
+                            else:
+                                subquery = (
+                                    Model.select(
+                                        Model.id, fn.MAX(field).alias(field_alias)
+                                    )
+                                    .group_by(*subquery_group_fields)
+                                    .alias(subquery_name)
+                                )
 
-                        predicate = (Model.id == subquery.c.id) & (
-                            field == getattr(subquery.c, field_alias)
-                        )
-                        query = query.join(subquery, on=predicate)
+                                if len(subquery_group_field_conditions) > 0:
+                                    subquery = subquery.where(
+                                        *subquery_group_field_conditions
+                                    )
 
-            # they want to get only one record so we save computation knowing that it won't use anyway
-            total = query.count()
-            query = query.limit(limit).offset(offset)
+                            # push limit & offset down to the subquery so the join only reads the
+                            # requested groups. it is only correct when each group matches exactly
+                            # one record, i.e., all conditions and sorted fields are on the group fields
+                            if (
+                                len(pending_ops) == 1
+                                and len(ops) == 1
+                                and not unique
+                                and all(f.name in group_names for f in conditions)
+                                and all(
+                                    fname in group_names for fname in order_by_names
+                                )
+                            ):
+                                if len(order_by) > 0 and use_window:
+                                    # the sorted fields are selected by the ranked records
+                                    subquery = subquery.order_by(
+                                        *[
+                                            getattr(
+                                                ranked.c, name2field[fname].column_name
+                                            ).desc()
+                                            if ob is not name2field[fname]
+                                            else getattr(
+                                                ranked.c, name2field[fname].column_name
+                                            )
+                                            for fname, ob in zip(
+                                                order_by_names, order_by
+                                            )
+                                        ]
+                                    )
+                                elif len(order_by) > 0:
+                                    subquery = subquery.order_by(*order_by)
+                                count_query = subquery if with_count else None
+                                subquery = subquery.limit(limit).offset(offset)
+                                is_paginated = True
+
+                            if use_window:
+                                predicate = Model.id == subquery.c.id
+                            else:
+                                predicate = (Model.id == subquery.c.id) & (
+                                    field == getattr(subquery.c, field_alias)
+                                )
+                            query = query.join(subquery, on=predicate)
+
+            if not is_paginated:
+                count_query = query if with_count else None
+                if (
+                    count_query is not None
+                    and not unique
+                    and support_window_function(Model._meta.database)
+                ):
+                    # get the total in the same query as the records so it does not need to
+                    # be counted separately when the page is full
+                    query = query.select_extend(
+                        fn.COUNT(SQL("*")).over().alias(WINDOW_TOTAL_ALIAS)
+                    )
+                    is_window_total = True
+                query = query.limit(limit).offset(offset)
+
+        def count_total(n_records: int, window_total: Optional[int] = None):
+            if count_query is None:
+                return total
+            if n_records < limit and (n_records > 0 or offset == 0):
+                # this is the last page so we know the total without counting
+                return offset + n_records
+            if window_total is not None:
+                return window_total
+            return count_query.count()
 
         # perform the query
-        items = batch_serialize(list(query))
-        if len(fields) > 0:
-            items = [{k: item[k] for k in field_names} for item in items]
+        if stream_records:
+            # rows read as dictionaries already contain only the selected fields
+            cursor = query.dicts().iterator()
+            # the query is executed and the first record is encoded before the response starts,
+            # so that errors are still reported by the status code instead of a truncated body
+            first_item = next(cursor, None)
+            first_window_total = None
+            if first_item is not None:
+                if is_window_total:
+                    first_window_total = first_item.pop(WINDOW_TOTAL_ALIAS)
+                first_item = dumps_record(first_item)
+
+            def generate():
+                yield b'{"items":['
+                n_records = 0
+                window_total = first_window_total
+                if first_item is not None:
+                    yield first_item
+                    n_records = 1
+                    for item in cursor:
+                        if is_window_total:
+                            window_total = item.pop(WINDOW_TOTAL_ALIAS)
+                        yield b"," + dumps_record(item)
+                        n_records += 1
+                yield b'],"total":' + dumps_json(
+                    count_total(n_records, window_total)
+                ) + b"}"
+
+            return Response(
+                stream_with_context(generate()), mimetype="application/json"
+            )
+
+        records = list(query)
+        items = batch_serialize(records, only=field_names if len(fields) > 0 else None)
+        return json_response(
+            {
+                "items": items,
+                "total": count_total(
+                    len(records),
+                    getattr(records[0], WINDOW_TOTAL_ALIAS)
+                    if is_window_total and len(records) > 0
+                    else None,
+                ),
+            }
+        )
+
+    if list_cache is None:
+        bp.route(f"/{table_name}", methods=["GET"])(get)
+    else:
 
-        return jsonify({"items": items, "total": total})
+        @bp.route(f"/{table_name}", methods=["GET"], endpoint="get")
+        def cached_get():
+            key = tuple(sorted(request.args.items(multi=True)))
+            body = list_cache.get_or_compute(key, lambda: get().get_data())
+            resp = Response(body, mimetype="application/json")
+            # the responses are cached on the server only as it is the one cache cleared when the
+            # records are modified, clients must revalidate them
+            resp.headers["Cache-Control"] = "private, no-cache"
+            return resp
 
     @bp.route(f"/{table_name}/find_by_ids", methods=["POST"])
     def get_by_ids():
-        if "ids" not in request.json:
+        args = request.args
+        body = request.get_json(cache=True)
+        if "ids" not in body:
             raise BadRequest("Bad request. Missing `ids`")
 
-        ids = request.json["ids"]
-        if "fields" in request.args:
-            field_names = request.args["fields"].split(",")
-            fields = [name2field[name] for name in field_names]
+        ids = body["ids"]
+        field_names, fields = parse_fields(args)
+
+        if len(fields) > 0:
+            query = Model.select(Model.id, *fields).where(Model.id.in_(ids))
         else:
-            field_names = []
-            fields = []
+            query = select_all.clone().where(Model.id.in_(ids))
 
-        records = list(Model.select(Model.id, *fields).where(Model.id.in_(ids)))
-        records = batch_serialize(records)
+        if read_dicts:
+            records = list(query.dicts())
+        else:
+            records = batch_serialize(list(query))
 
         if len(field_names) > 0:
-            records = {
-                item["id"]: {k: item[k] for k in field_names if k in item}
-                for item in records
-            }
+            if read_dicts:
+                # rows read as dictionaries only contain the selected fields and the id
+                if "id" in field_names:
+                    records = {item["id"]: item for item in records}
+                else:
+                    records = {item.pop("id"): item for item in records}
+            else:
+                project = gen_project(field_names)
+                records = {item["id"]: project(item) for item in records}
 
-        return jsonify({"items": records, "total": len(records)})
+        return json_response({"items": records, "total": len(records)})
 
     @bp.route(f"/{table_name}/<id>", methods=["GET"])
     def get_one(id):
-        if "fields" in request.args:
-            field_names = request.args["fields"].split(",")
-            fields = [name2field[name] for name in field_names]
-        else:
-            field_names = []
-            fields = []
+        field_names, fields = parse_fields(request.args)
 
-        records = list(Model.select(*fields).where(Model.id == id))
+        if len(fields) > 0:
+            query = Model.select(*fields).where(Model.id == id)
+        else:
+            query = select_all.clone().where(Model.id == id)
+        records = list(query.dicts() if read_dicts else query)
         if len(records) == 0:
             raise NotFound(f"Record {id} does not exist")
 
-        record = serialize(records[0])
-        if len(fields) > 0:
-            record = {k: record[k] for k in field_names}
+        if read_dicts:
+            record = records[0]
+        else:
+            record = serialize(records[0])
+            if len(field_names) > 0:
+                record = gen_project(field_names)(record)
 
-        return jsonify(record)
+        # tag the response by the hash of its content, so the tag changes whenever the record is
+        # modified (by this API or not) and clients can reuse their cached copy otherwise
+        resp = json_response(record)
+        resp.add_etag()
+        return resp.make_conditional(request)
 
     @bp.route(f"/{table_name}/<id>", methods=["HEAD"])
     def has(id):
-        if not Model.select().where(Model.id == id).exists():
+        if not select_all.clone().where(Model.id == id).exists():
             raise NotFound(f"Record {id} does not exist")
-        return jsonify()
+        return json_response(None)
 
     @bp.route(f"/{table_name}", methods=["POST"])
     def create():
-        posted_record = request.json
-        raw_record = {}
-
-        for name, field in name2field.items():
-            if name in posted_record:
-                try:
-                    raw_record[name] = deserializers[name](posted_record[name])
-                except ValueError as e:
-                    raise ValueError(f"Field `{name}` {str(e)}")
+        """Create a record. If the query has `upsert=true`, the record matching all the posted
+        fields (and only them) is returned instead if it exists."""
+        posted_record = request.get_json(cache=True)
+        raw_record = parse_record(posted_record)
         if "id" in raw_record:
             # remove id as this API always creates a new record
             raw_record.pop("id")
+        if request.args.get("upsert", "false") == "true":
+            if len(raw_record) == 0:
+                # without any field, every record would match
+                raise BadRequest("Upsert requires at least one field")
+            # return the record that has the same values if it exists instead of creating a new one,
+            # so clients do not need another request to check for it
+            record, created = Model.get_or_create(**raw_record)
+            if created:
+                invalidate_cache()
+            return json_response(serialize(record))
+
         record = Model.create(**raw_record)
+        invalidate_cache()
         # TODO: correct return types according to RESTful specification https://restfulapi.net/http-methods/
-        return jsonify(serialize(record))
+        return json_response(serialize(record))
 
     @bp.route(f"/{table_name}/<id>", methods=["PUT"])
     def update(id):
-        try:
-            record = Model.get_by_id(id)
-        except DoesNotExist as e:
-            raise NotFound(f"Record {id} does not exist")
+        """Update a record. If the query has `return=minimal`, the record is updated in a single
+        statement and only its id is returned."""
+        if request.args.get("return", None) == "minimal":
+            record = None
+            # the id is returned with the same type as the other endpoints, not as the url segment
+            try:
+                id = parse_id(id)
+            except ValueError:
+                raise NotFound(f"Record {id} does not exist")
+        else:
+            try:
+                record = Model.get_by_id(id)
+            except DoesNotExist as e:
+                raise NotFound(f"Record {id} does not exist")
 
-        request_json = request.get_json()
+        request_json = request.get_json(cache=True)
         if request_json is None:
             raise BadRequest("Missing request body")
 
-        for name, field in name2field.items():
-            if name in request_json:
-                try:
-                    value = deserializers[name](request_json[name])
-                except ValueError as e:
-                    raise ValueError(f"Field `{name}` {str(e)}")
-
-                setattr(record, name, value)
+        raw_record = parse_record(request_json)
+        # the id of the record is never changed, clients may send it back with the other fields
+        raw_record.pop("id", None)
+
+        if record is None:
+            if len(raw_record) > 0:
+                n_updated = Model.update(**raw_record).where(Model.id == id).execute()
+            else:
+                n_updated = int(select_all.clone().where(Model.id == id).exists())
+            if n_updated == 0:
+                raise NotFound(f"Record {id} does not exist")
+            invalidate_cache()
+            return json_response({"id": id})
+
+        for name, value in raw_record.items():
+            setattr(record, name, value)
         record.save()
+        invalidate_cache()
 
-        return jsonify(serialize(record))
+        return json_response(serialize(record))
 
     @bp.route(f"/{table_name}/<id>", methods=["DELETE"])
     def delete_by_id(id):
-        try:
-            Model.get_by_id(id).delete_instance()
-        except DoesNotExist as e:
+        if Model.delete().where(Model.id == id).execute() == 0:
             raise NotFound(f"Record {id} does not exist")
+        invalidate_cache()
 
-        return jsonify({"status": "success"})
+        return json_response({"status": "success"})
 
     if enable_truncate_table:
 
         @bp.route(f"/{table_name}", methods=["DELETE"])
         def truncate():
             Model.truncate_table()
-            return jsonify({"status": "success"})
+            invalidate_cache()
+            return json_response({"status": "success"})
 
     return bp
 
@@ -391,11 +854,12 @@ def generate_readonly_api_4dict(
         if len(field_names) > 0:
             record = {k: record[k] for k in field_names if k in record}
 
-        return jsonify({"items": [record], "total": 1})
+        return json_response({"items": [record], "total": 1})
 
     @bp.route(f"/{name}/find_by_ids", methods=["POST"])
     def find_by_ids():
-        if "ids" not in request.json:  # type: ignore
+        body = request.get_json(cache=True)
+        if "ids" not in body:  # type: ignore
             raise BadRequest("Bad request. Missing `ids`")
 
         if "fields" in request.args:
@@ -403,20 +867,16 @@ def generate_readonly_api_4dict(
         else:
             field_names = []
 
-        ids = []
-        ents = []
-        for id in request.json["ids"]:
-            if id in id2ent:
-                ents.append(id2ent[id])
-                ids.append(id)
-
-        records = batch_serialize(ents)
+        id2ents = {id: id2ent[id] for id in body["ids"] if id in id2ent}
+        records = batch_serialize(list(id2ents.values()))
         if len(field_names) > 0:
             records = [
                 {k: item[k] for k in field_names if k in item} for item in records
             ]
 
-        return jsonify({"items": dict(zip(ids, records)), "total": len(ents)})
+        return json_response(
+            {"items": dict(zip(id2ents.keys(), records)), "total": len(id2ents)}
+        )
 
     @bp.route(f"/{name}/<id>", methods=["GET"])
     def find_by_id(id: str):
@@ -433,15 +893,103 @@ def generate_readonly_api_4dict(
         if len(field_names) > 0:
             record = {k: record[k] for k in field_names if k in record}
 
-        return jsonify(record)
+        return json_response(record)
 
     return bp
 
 
-def gen_batch_serialize(
-    serialize: Callable[[Any], dict]
-) -> Callable[[List[Any]], List[dict]]:
-    def batch_serialize(lst):
-        return [serialize(item) for item in lst]
+def gen_batch_serialize(serialize: Callable[[Any], dict]) -> Callable[..., List[dict]]:
+    """Generate a batch serialize function that can optionally keep only some fields of the records"""
+
+    def batch_serialize(lst, only: Optional[List[str]] = None):
+        if only is None:
+            # map calls the (generated) serializer from C without a loop in Python
+            return list(map(serialize, lst))
+        return list(map(gen_project(only), map(serialize, lst)))
 
     return batch_serialize
+
+
+def gen_projected_batch_serialize(
+    batch_serialize: Callable[[List[Any]], List[dict]]
+) -> Callable[..., List[dict]]:
+    """Wrap a user-provided batch serialize function so that it supports the `only` argument as the generated one"""
+
+    def projected_batch_serialize(lst, only: Optional[List[str]] = None):
+        records = batch_serialize(lst)
+        if only is None:
+            return records
+        return list(map(gen_project(only), records))
+
+    return projected_batch_serialize
+
+
+def gen_project(field_names: List[str]) -> Callable[[dict], dict]:
+    """Generate a function that keeps only the given fields of a serialized record. The fields
+    that are not in the record (e.g., left out by a custom serializer) are skipped.
+    """
+    if len(field_names) == 1:
+        field_name = field_names[0]
+        return lambda record: (
+            {field_name: record[field_name]} if field_name in record else {}
+        )
+
+    getter = operator.itemgetter(*field_names)
+
+    def project(record: dict) -> dict:
+        try:
+            return dict(zip(field_names, getter(record)))
+        except KeyError:
+            return {name: record[name] for name in field_names if name in record}
+
+    return project
+
+
+def gen_dumps_with_raw_json(
+    raw_json_names: List[str], field_names: List[str]
+) -> Callable[[dict], bytes]:
+    """Generate a function encoding a record to JSON, in which the values of the given raw JSON
+    fields are already encoded JSON and are copied to the output as they are.
+
+    The fields are encoded in the given order, not the order of the keys of the record, as the
+    database cursor may put the columns that are not converted first.
+    """
+    # consecutive fields that are not raw JSON are encoded together, each segment is either
+    # (encoded key of a raw JSON field, its name) or (None, names of the other fields)
+    segments = []
+    for name in field_names:
+        if name in raw_json_names:
+            segments.append((dumps_json(name) + b":", name))
+        elif len(segments) > 0 and segments[-1][0] is None:
+            segments[-1][1].append(name)
+        else:
+            segments.append((None, [name]))
+
+    def dumps(item: dict) -> bytes:
+        parts = []
+        for key, names in segments:
+            if key is None:
+                # strip the braces of the encoded object to splice its fields
+                parts.append(dumps_json({name: item[name] for name in names})[1:-1])
+            else:
+                value = item[names]
+                parts.append(key + (b"null" if value is None else value))
+        return b"{" + b",".join(parts) + b"}"
+
+    return dumps
+
+
+@lru_cache(maxsize=None)
+def gen_model_serializer(Model: Type[PeeweeModel]) -> Callable[[Any], dict]:
+    """Generate a function serializing a record of the model to a dictionary, equivalent to
+    `model_to_dict(record, recurse=False)`, as straight-line code reading the fields of the record.
+    The function is generated once per model.
+    """
+    items = ", ".join(
+        f"{field.name!r}: data.get({field.name!r})"
+        for field in Model._meta.sorted_fields
+    )
+    src = f"def serialize(record):\n    data = record.__data__\n    return {{{items}}}"
+    namespace = {}
+    exec(compile(src, f"<gena.serialize:{Model.__name__}>", "exec"), namespace)
+    return namespace["serialize"]
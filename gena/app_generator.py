@@ -7,13 +7,25 @@ from pathlib import Path
 from typing import Optional, Union, List
 
 from flask import Flask, render_template, Blueprint, send_from_directory
+from peewee import Database
 
 
 def generate_app(
     controllers: Union[List[Blueprint], Module],
     pkg_dir: Union[str, Path],
     log_sql_queries: bool = True,
+    database: Optional[Database] = None,
 ):
+    """Generate a Flask app serving the APIs of the controllers and the frontend in `<pkg_dir>/www`
+
+    Args:
+        controllers: list of blueprints or a package of modules containing the blueprints
+        pkg_dir: directory of the package containing the frontend
+        log_sql_queries: whether to log the SQL queries in development mode
+        database: if provided, a connection is opened at the beginning of each request and closed
+            at its end. Use a pooled database (e.g., PooledPostgresqlExtDatabase, PooledSqliteDatabase)
+            so that closing returns the connection to the pool instead of reconnecting every request
+    """
     if log_sql_queries and os.environ.get("FLASK_ENV", "") == "development":
         # if debugging, log the SQL queries
         logger = logging.getLogger("peewee")
@@ -27,6 +39,17 @@ def generate_app(
     )
     app.config["JSON_SORT_KEYS"] = False
 
+    if database is not None:
+
+        @app.before_request
+        def _db_connect():
+            database.connect(reuse_if_open=True)
+
+        @app.teardown_request
+        def _db_close(exc):
+            if not database.is_closed():
+                database.close()
+
     @app.route("/", defaults={"path": ""})
     @app.route("/<path:path>")
     def home(path):
@@ -39,13 +62,16 @@ def generate_app(
     if isinstance(controllers, list):
         blueprints = controllers
     else:
-        # auto discover blueprints
+        # auto discover blueprints, a blueprint imported by multiple modules is registered once
         blueprints = []
+        seen_ids = set()
         for m in pkgutil.iter_modules(controllers.__path__):
             controller = importlib.import_module(f"{controllers.__name__}.{m.name}")
-            for attrname in dir(controller):
-                attr = getattr(controller, attrname)
-                if isinstance(attr, Blueprint):
+            # scan the module namespace directly, inspect.getmembers sorts all names and gets
+            # each attribute through getattr
+            for attr in list(vars(controller).values()):
+                if isinstance(attr, Blueprint) and id(attr) not in seen_ids:
+                    seen_ids.add(id(attr))
                     blueprints.append(attr)
 
     for bp in blueprints:
@@ -0,0 +1,59 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class TTLCache:
+    """Thread-safe in-memory cache whose entries expire after `ttl` seconds.
+
+    Concurrent computations of the same key are deduplicated: only one thread computes the value
+    while the others wait and reuse its result.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 1024) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.entries: Dict[Hashable, Tuple[float, Any]] = {}
+        self.inflight: Dict[Hashable, threading.Event] = {}
+        # increased every time the cache is cleared so that values computed before that are discarded
+        self.generation = 0
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None and entry[0] > time.monotonic():
+                    return entry[1]
+                event = self.inflight.get(key)
+                if event is None:
+                    event = self.inflight[key] = threading.Event()
+                    generation = self.generation
+                    break
+            # another thread is computing the value, wait for it and check the cache again
+            event.wait()
+
+        try:
+            value = compute()
+            with self.lock:
+                if generation == self.generation:
+                    self._set(key, value)
+        finally:
+            with self.lock:
+                del self.inflight[key]
+            event.set()
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+    def _set(self, key: Hashable, value: Any):
+        now = time.monotonic()
+        if len(self.entries) >= self.maxsize:
+            self.entries = {k: v for k, v in self.entries.items() if v[0] > now}
+            while len(self.entries) >= self.maxsize:
+                # remove the oldest entries
+                self.entries.pop(next(iter(self.entries)))
+        self.entries[key] = (now + self.ttl, value)
@@ -1,5 +1,5 @@
 import requests
-from typing import Type, Union
+from typing import Optional, Type, Union
 
 from peewee import Model as PeeweeModel, DoesNotExist, fn
 from loguru import logger
@@ -10,13 +10,17 @@ ID = Union[str, int]
 class Client:
     """Client to communicate with the API"""
 
-    def __init__(self, endpoint: str) -> None:
+    def __init__(
+        self, endpoint: str, session: Optional[requests.Session] = None
+    ) -> None:
         self.endpoint = endpoint
+        # keep the connections to the server alive between requests
+        self.session = session or requests.Session()
 
     def create(self, record: dict):
         record = self.filter_none(record)
         assert "id" not in record
-        resp = requests.post(f"{self.endpoint}", json=record)
+        resp = self.session.post(f"{self.endpoint}", json=record)
         self.assert_resp(resp)
         return resp.json()
 
@@ -27,22 +31,13 @@ class Client:
             self.update(record)
             return record
 
-        resp = requests.get(self.endpoint, params=record)
+        # the server returns the existing record or creates it in one request
+        resp = self.session.post(self.endpoint, json=record, params={"upsert": "true"})
         self.assert_resp(resp)
-        items = resp.json()["items"]
-        if len(items) == 0:
-            # not found, we create it
-            resp = requests.post(self.endpoint, json=record)
-            self.assert_resp(resp)
-            record = resp.json()
-        else:
-            assert len(items) == 1, "Upsert should only affect one record"
-            record = items[0]
-
-        return record
+        return resp.json()
 
     def update(self, record: dict):
-        resp = requests.put(
+        resp = self.session.put(
             f"{self.endpoint}/{record['id']}", json=self.filter_none(record)
         )
         self.assert_resp(resp)
@@ -55,19 +50,19 @@ class Client:
         ):
             id = record_or_id["id"] if isinstance(record_or_id, dict) else record_or_id
 
-            resp = requests.head(f"{self.endpoint}/{id}")
+            resp = self.session.head(f"{self.endpoint}/{id}")
             if resp.status_code == 404:
                 return False
             self.assert_resp(resp)
             return True
 
         record = self.filter_none(record_or_id)
-        resp = requests.get(f"{self.endpoint}", params=record)
+        resp = self.session.get(f"{self.endpoint}", params=record)
         self.assert_resp(resp)
         return len(resp.json()["items"]) > 0
 
     def get(self, queries: dict):
-        resp = requests.get(f"{self.endpoint}", params=queries)
+        resp = self.session.get(f"{self.endpoint}", params=queries)
         self.assert_resp(resp)
         return resp.json()["items"]
 
@@ -79,7 +74,7 @@ class Client:
         return items[0]
 
     def get_by_id(self, id: str):
-        resp = requests.get(f"{self.endpoint}/{id}")
+        resp = self.session.get(f"{self.endpoint}/{id}")
         self.assert_resp(resp)
         return resp.json()
 
@@ -89,7 +84,7 @@ class Client:
             or record_or_id.get("id", None) is not None
         ):
             id = record_or_id["id"] if isinstance(record_or_id, dict) else record_or_id
-            resp = requests.delete(f"{self.endpoint}/{id}")
+            resp = self.session.delete(f"{self.endpoint}/{id}")
             self.assert_resp(resp)
         else:
             raise NotImplementedError("The function does not support on server as well")
@@ -1,74 +1,200 @@
 import orjson
 from abc import ABC, abstractclassmethod, abstractstaticmethod
 from typing import List, Optional, Type
-from peewee import Field
+from peewee import Field, Model as PeeweeModel
 from dataclasses import astuple, dataclass, fields
+from operator import attrgetter
 
 
-# db_null = b"null"
-db_null = None
+# serialize dataclasses natively, and allow dictionaries with non-string keys
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_DATACLASS | orjson.OPT_NON_STR_KEYS
 
 
 class DataClassField(Field):
     field_type = "BLOB"
 
-    def __init__(self, CLS: Type[object], **kwargs):
+    def __init__(self, CLS: Type[object], raw_json: bool = False, **kwargs):
+        """
+        Args:
+            CLS: the dataclass of the values
+            raw_json: when True, the API listing records sends the stored JSON to clients as it is
+                instead of decoding and encoding it again. Values stored as arrays of field values
+                by previous versions are sent as arrays, so rewrite them to use this option
+        """
         super().__init__(**kwargs)
         self.CLS = CLS
+        self.raw_json = raw_json
+        # dataclasses are stored as JSON objects, except the ones that know how to restore themselves
+        # from tuples, which are stored as arrays of their field values
+        self.store_tuple = hasattr(CLS, "from_tuple")
+        if raw_json and self.store_tuple:
+            raise ValueError(
+                f"`raw_json` cannot be used with {CLS.__name__} as it is stored as tuples instead of JSON objects"
+            )
         if hasattr(CLS, "from_tuple"):
             self.from_tuple = getattr(CLS, "from_tuple")
         else:
             self.from_tuple = lambda x: CLS(*x)  # type: ignore
 
+    def from_json(self, value):
+        if isinstance(value, list):
+            # stored as a tuple (by the previous versions or `store_tuple`)
+            return self.from_tuple(value)
+        return self.from_dict(value)
+
+    def from_dict(self, value):
+        """Restore a dataclass from its JSON object, nested dataclasses included.
+
+        The deserializer is generated at the first call (annotations of the dataclass may refer to
+        classes defined after the field), then it replaces this method on the instance.
+        """
+        from gena.deserializer import get_dataclass_deserializer
+
+        CLS = self.CLS
+        deserialize = get_dataclass_deserializer(CLS, {})
+        if deserialize is None:
+            deserialize = lambda x: CLS(**x)  # type: ignore
+        self.from_dict = deserialize
+        return deserialize(value)
+
     def db_value(self, value):
         if value is None:
             return value
-        return orjson.dumps(astuple(value))
+        if self.store_tuple:
+            return orjson.dumps(astuple(value))
+        return orjson.dumps(value, option=ORJSON_OPTIONS)
 
     def python_value(self, value):
-        if value == db_null:
+        if value is None:
             return None
         value = orjson.loads(value)
-        return self.from_tuple(value)
+        return self.from_json(value)
 
 
 class ListDataClassField(DataClassField):
+    def __init__(self, CLS: Type[object], columnar: bool = False, **kwargs):
+        """
+        Args:
+            CLS: the dataclass of the items
+            columnar: when True, the list is stored as a JSON object mapping each field to the list
+                of its values in the items, so field names are stored once instead of once per item
+        """
+        super().__init__(CLS, **kwargs)
+        if columnar and (self.raw_json or self.store_tuple):
+            raise ValueError(
+                "columnar storage cannot be used with `raw_json` or dataclasses restored from tuples"
+            )
+        self.columnar = columnar
+        self.field_names = [field.name for field in fields(CLS)]
+        if len(self.field_names) == 1:
+            name = self.field_names[0]
+            self.get_field_values = lambda item: (getattr(item, name),)
+        else:
+            self.get_field_values = attrgetter(*self.field_names)
+
     def db_value(self, value):
-        return orjson.dumps([astuple(item) for item in value])
+        if value is None:
+            return value
+        if self.columnar:
+            rows = list(map(self.get_field_values, value))
+            if len(rows) == 0:
+                columns = [[] for _ in self.field_names]
+            else:
+                columns = list(zip(*rows))
+            return orjson.dumps(
+                dict(zip(self.field_names, columns)), option=ORJSON_OPTIONS
+            )
+        if self.store_tuple:
+            return orjson.dumps(list(map(astuple, value)))
+        return orjson.dumps(value, option=ORJSON_OPTIONS)
 
     def python_value(self, value):
-        if value == db_null:
+        if value is None:
             return None
 
         value = orjson.loads(value)
-        return [self.from_tuple(item) for item in value]
+        if isinstance(value, dict):
+            # stored in columns, fields added to the dataclass afterward get their default values
+            names = [name for name in self.field_names if name in value]
+            return [
+                self.from_dict(dict(zip(names, row)))
+                for row in zip(*[value[name] for name in names])
+            ]
+        return [self.from_json(item) for item in value]
 
 
 class DictDataClassField(DataClassField):
     def db_value(self, value):
-        return orjson.dumps({k: astuple(item) for k, item in value.items()})
+        if value is None:
+            return value
+        if self.store_tuple:
+            return orjson.dumps(
+                dict(zip(value.keys(), map(astuple, value.values()))),
+                option=ORJSON_OPTIONS,
+            )
+        return orjson.dumps(value, option=ORJSON_OPTIONS)
 
     def python_value(self, value):
-        if value == db_null:
+        if value is None:
             return None
 
         value = orjson.loads(value)
-        return {k: self.from_tuple(item) for k, item in value.items()}
+        return {k: self.from_json(item) for k, item in value.items()}
 
 
 class Dict2ListDataClassField(DataClassField):
     def db_value(self, value):
-        try:
+        if value is None:
+            return value
+        if self.store_tuple:
             return orjson.dumps(
-                {k: [astuple(item) for item in lst] for k, lst in value.items()}
+                {k: list(map(astuple, lst)) for k, lst in value.items()},
+                option=ORJSON_OPTIONS,
             )
-        except:
-            print(value)
-            raise
+        return orjson.dumps(value, option=ORJSON_OPTIONS)
 
     def python_value(self, value):
-        if value == db_null:
+        if value is None:
             return None
 
         value = orjson.loads(value)
-        return {k: [self.from_tuple(item) for item in lst] for k, lst in value.items()}
+        return {k: [self.from_json(item) for item in lst] for k, lst in value.items()}
+
+
+def migrate_dataclass_fields(
+    Model: Type[PeeweeModel],
+    fields: Optional[List[DataClassField]] = None,
+    batch_size: int = 1000,
+):
+    """Rewrite the stored values of the dataclass fields of a model in their current format.
+
+    Values stored as arrays of field values by previous versions are still readable, but they do
+    not match the values stored as JSON objects, e.g., in the conditions of queries and upserts.
+
+    Args:
+        Model: the model whose records are rewritten
+        fields: the dataclass fields to rewrite, default to all dataclass fields of the model
+        batch_size: number of records read at a time
+    """
+    if fields is None:
+        fields = [
+            field
+            for field in Model._meta.sorted_fields
+            if isinstance(field, DataClassField)
+        ]
+    if len(fields) == 0:
+        return
+
+    primary_key = Model._meta.primary_key
+    query = Model.select(primary_key, *fields).order_by(primary_key)
+    with Model._meta.database.atomic():
+        page = 1
+        while True:
+            records = list(query.paginate(page, batch_size))
+            for record in records:
+                Model.update(
+                    {field: getattr(record, field.name) for field in fields}
+                ).where(primary_key == record._pk).execute()
+            if len(records) < batch_size:
+                break
+            page += 1
@@ -1,7 +1,10 @@
+from datetime import datetime, timezone
+from functools import lru_cache
 from typing import (
     Any,
     Callable,
     Dict,
+    ForwardRef,
     List,
     Literal,
     Optional,
@@ -20,7 +23,13 @@ from gena.custom_fields import (
     ListDataClassField,
 )
 from peewee import (
+    AutoField,
+    BigAutoField,
+    BigIntegerField,
     CharField,
+    DateTimeField,
+    DoubleField,
+    SmallIntegerField,
     Model,
     Field,
     FloatField,
@@ -31,28 +40,96 @@ from peewee import (
     TextField,
     Value,
 )
-from dataclasses import fields, is_dataclass
+from dataclasses import MISSING, fields, is_dataclass
+from werkzeug.http import parse_date as parse_http_date
+
+try:
+    # C parser of ISO 8601 strings, which is faster than datetime.fromisoformat
+    from ciso8601 import parse_datetime as parse_iso_datetime
+except ImportError:
+
+    def parse_iso_datetime(value: str) -> datetime:
+        if value.endswith("Z"):
+            # fromisoformat does not support the Z suffix before python 3.11
+            value = value[:-1] + "+00:00"
+        return datetime.fromisoformat(value)
+
+
+try:
+    # annotations of a class itself, which are evaluated lazily since python 3.14 (PEP 649)
+    from inspect import get_annotations
+except ImportError:
+
+    def get_annotations(cls) -> Dict[str, Any]:
+        # before python 3.10, the annotations are stored in the class dictionary
+        return vars(cls).get("__annotations__", {})
 
 
 Deserializer = Callable[[Any], Any]
 
 
+@lru_cache(maxsize=None)
+def get_cached_type_hints(cls) -> Dict[str, Any]:
+    """Get type hints of a class. They are evaluated only once per class as it is slow"""
+    # merge the annotations of the class and its bases directly when there is nothing to evaluate,
+    # as get_type_hints does but without its evaluation machinery
+    hints = {}
+    for klass in reversed(cls.__mro__):
+        for name, annotation in get_annotations(klass).items():
+            if annotation is None:
+                annotation = type(None)
+            elif need_evaluation(annotation):
+                return get_type_hints(cls)
+            hints[name] = annotation
+    return hints
+
+
+def need_evaluation(annotation) -> bool:
+    """Whether get_type_hints would change the annotation, i.e., it has forward references
+    (strings) or extra metadata (Annotated)"""
+    if isinstance(annotation, (str, ForwardRef)) or hasattr(annotation, "__metadata__"):
+        return True
+    if get_origin(annotation) is Literal:
+        return False
+    return any(need_evaluation(arg) for arg in get_args(annotation))
+
+
 def generate_deserializer(
     Model: Type[Model], known_type_deserializers: Dict[Any, Deserializer] = None
 ) -> Dict[str, Deserializer]:
-    known_type_deserializers = known_type_deserializers or {}
-    fields = Model._meta.fields
-    field_type_hints = get_type_hints(Model)
+    """Generate deserializers of the fields of the model. They are generated once per model and
+    known type deserializers, and a new dictionary is returned every call so it can be modified.
+    """
+    known_items = tuple((known_type_deserializers or {}).items())
+    try:
+        return dict(_generate_deserializer(Model, known_items))
+    except TypeError:
+        # the known types are not hashable, so we can't cache the result
+        return _generate_deserializer.__wrapped__(Model, known_items)
+
+
+@lru_cache(maxsize=None)
+def _generate_deserializer(
+    Model: Type[Model], known_items: tuple
+) -> Dict[str, Deserializer]:
+    known_type_deserializers = dict(known_items)
+    field_type_hints = get_cached_type_hints(Model)
 
     output = {}
-    for name, field in fields.items():
-        func = None
-        if isinstance(field, IntegerField):
+    for field in Model._meta.sorted_fields:
+        name = field.name
+        # common field types are resolved by a lookup of their exact types first
+        func = FIELD_DESERIALIZERS.get(type(field))
+        if func is not None:
+            pass
+        elif isinstance(field, IntegerField):
             func = deserialize_int
         elif isinstance(field, FloatField):
             func = deserialize_float
         elif isinstance(field, BooleanField):
             func = deserialize_bool
+        elif isinstance(field, DateTimeField):
+            func = deserialize_datetime
         elif isinstance(field, _StringField):
             if isinstance(field, CharField) or type(field) is TextField:
                 if (
@@ -90,60 +167,113 @@ def generate_deserializer(
             if func is None:
                 continue
 
-            if type(field) is ListDataClassField:
-                func = get_deserialize_list(func)
-            elif type(field) is DictDataClassField:
-                func = get_deserialize_dict(func)
-            elif type(field) is Dict2ListDataClassField:
-                func = get_deserialize_dict(get_deserialize_list(func))
+            wrap = DATACLASS_FIELD_WRAPPERS.get(type(field))
+            if wrap is not None:
+                func = wrap(func)
         else:
             continue
 
         assert func is not None
+        if field.null:
+            func = get_deserialize_optional(func)
         output[name] = func
     return output
 
 
+def get_record_deserializer(
+    field2deserializer: Dict[str, Deserializer]
+) -> Callable[[dict], dict]:
+    """Generate a function deserializing the fields of a record (dictionary) that are present.
+
+    The function is generated as straight-line code with one block per field so that there is no
+    loop or dictionary lookup of the deserializers when it is called.
+    """
+    lines = ["def deserialize_record(value):", "    output = {}"]
+    namespace = {}
+    for i, (field, func) in enumerate(field2deserializer.items()):
+        namespace[f"deser_{i}"] = func
+        msg = "Field `" + field.replace("{", "{{").replace("}", "}}") + "` {str(e)}"
+        lines += [
+            f"    if {field!r} in value:",
+            "        try:",
+            f"            output[{field!r}] = deser_{i}(value[{field!r}])",
+            "        except ValueError as e:",
+            f"            raise ValueError(f{msg!r})",
+        ]
+    lines.append("    return output")
+
+    exec(compile("\n".join(lines), "<gena.deserialize_record>", "exec"), namespace)
+    return namespace["deserialize_record"]
+
+
+# the leaf deserializers dispatch on the exact type of the value, which is what JSON decoders
+# produce. booleans are not accepted as numbers even though bool is a subclass of int
+
+
 def deserialize_int(value):
-    if isinstance(value, int):
+    value_type = type(value)
+    if value_type is int:
         return value
 
-    if isinstance(value, str):
+    if value_type is str:
         return int(value)
 
-    if isinstance(value, float):
-        if value == int(value):
-            return int(value)
+    if value_type is float and value.is_integer():
+        return int(value)
 
-    raise ValueError(f"expect integer but get: {type(value)}")
+    raise ValueError(f"expect integer but get: {value_type}")
 
 
 def deserialize_bool(value):
-    if isinstance(value, bool):
+    value_type = type(value)
+    if value_type is bool:
         return value
 
-    if isinstance(value, str):
+    if value_type is str:
         if value != "true" and value != "false":
             raise ValueError(f"expect bool string but get: {value}")
         return value == "true"
 
-    raise ValueError(f"expect bool value but get: {type(value)}")
+    raise ValueError(f"expect bool value but get: {value_type}")
 
 
 def deserialize_str(value):
-    if isinstance(value, str):
+    if type(value) is str:
         return value
     raise ValueError(f"expect string but get: {type(value)}")
 
 
 def deserialize_float(value):
-    if isinstance(value, (int, float)):
+    value_type = type(value)
+    if value_type is float or value_type is int:
         return value
 
-    if isinstance(value, str):
+    if value_type is str:
         return float(value)
 
-    raise ValueError(f"expect float but get: {type(value)}")
+    raise ValueError(f"expect float but get: {value_type}")
+
+
+def deserialize_datetime(value):
+    if isinstance(value, datetime):
+        return value
+
+    if type(value) is str:
+        try:
+            dt = parse_iso_datetime(value)
+        except ValueError:
+            # the API sends datetimes as HTTP dates, so clients can send them back
+            dt = parse_http_date(value)
+            if dt is None:
+                raise ValueError(
+                    f"expect ISO 8601 or HTTP datetime string but get: {value}"
+                )
+        if dt.tzinfo is not None:
+            # datetimes are stored in UTC without timezone
+            dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+        return dt
+
+    raise ValueError(f"expect datetime string but get: {type(value)}")
 
 
 def deserialize_number_or_string(value):
@@ -158,20 +288,91 @@ def deserialize_none(value):
     return value
 
 
+# types of values that the leaf deserializers return unchanged
+DESERIALIZER_IDENTITY_TYPES = {
+    deserialize_int: {int},
+    deserialize_float: {int, float},
+    deserialize_bool: {bool},
+    deserialize_str: {str},
+}
+
+
+# the leaf deserializers accepting None, they return the common values without another function call
+def deserialize_optional_int(value):
+    if value is None or type(value) is int:
+        return value
+    return deserialize_int(value)
+
+
+def deserialize_optional_float(value):
+    if value is None or type(value) is float:
+        return value
+    return deserialize_float(value)
+
+
+def deserialize_optional_bool(value):
+    if value is None or type(value) is bool:
+        return value
+    return deserialize_bool(value)
+
+
+def deserialize_optional_str(value):
+    if value is None or type(value) is str:
+        return value
+    return deserialize_str(value)
+
+
+OPTIONAL_DESERIALIZERS = {
+    deserialize_int: deserialize_optional_int,
+    deserialize_float: deserialize_optional_float,
+    deserialize_bool: deserialize_optional_bool,
+    deserialize_str: deserialize_optional_str,
+}
+
+
+def get_deserialize_optional(deserialize: Deserializer):
+    if deserialize in OPTIONAL_DESERIALIZERS:
+        return OPTIONAL_DESERIALIZERS[deserialize]
+
+    def deserialize_optional(value):
+        if value is None:
+            return value
+        return deserialize(value)
+
+    return deserialize_optional
+
+
 def get_deserialize_list(deserialize_item: Deserializer):
+    identity_types = DESERIALIZER_IDENTITY_TYPES.get(deserialize_item)
+    if identity_types is not None:
+        # collecting types of the items runs in C, so when all items already have the expected
+        # types, we copy the list without calling the item deserializer for each item
+        def deserialize_leaf_list(value):
+            if not isinstance(value, list):
+                raise ValueError(f"expect list but get {type(value)}")
+            if set(map(type, value)) <= identity_types:
+                return value[:]
+            return list(map(deserialize_item, value))
+
+        return deserialize_leaf_list
+
     def deserialize_list(value):
         if not isinstance(value, list):
             raise ValueError(f"expect list but get {type(value)}")
-        return [deserialize_item(item) for item in value]
+        return list(map(deserialize_item, value))
 
     return deserialize_list
 
 
 def get_deserialize_set(deserialize_item: Deserializer):
+    identity_types = DESERIALIZER_IDENTITY_TYPES.get(deserialize_item)
+
     def deserialize_set(value):
         if not isinstance(value, set):
             raise ValueError(f"expect set but get {type(value)}")
-        return {deserialize_item(item) for item in value}
+        if identity_types is not None and set(map(type, value)) <= identity_types:
+            return set(value)
+        return set(map(deserialize_item, value))
 
     return deserialize_set
 
@@ -185,8 +386,55 @@ def get_deserialize_dict(deserialize_item: Deserializer):
     return deserialize_dict
 
 
+def get_deserialize_homogeneous_tuple(deserialize_item: Deserializer):
+    def deserialize_homogeneous_tuple(value):
+        if not isinstance(value, (list, tuple)):
+            raise ValueError(f"expect tuple but get {type(value)}")
+        return tuple(map(deserialize_item, value))
+
+    return deserialize_homogeneous_tuple
+
+
+def get_deserialize_tuple(deserialize_items: List[Deserializer]):
+    """Generate a function deserializing a fixed-size tuple, which deserializes the items by their
+    positions without zipping the values with the deserializers.
+    """
+    size = len(deserialize_items)
+    items = "".join(f"deser_{i}(value[{i}]), " for i in range(size))
+    lines = [
+        "def deserialize_tuple(value):",
+        f"    if not isinstance(value, (list, tuple)) or len(value) != {size}:",
+        f'        raise ValueError(f"expect tuple of {size} items but get {{value}}")',
+        f"    return ({items})",
+    ]
+    namespace = {f"deser_{i}": func for i, func in enumerate(deserialize_items)}
+    exec(compile("\n".join(lines), "<gena.deserialize_tuple>", "exec"), namespace)
+    return namespace["deserialize_tuple"]
+
+
 def get_deserializer_from_type(
     annotated_type, known_type_deserializers: Dict[str, Deserializer]
+) -> Optional[Deserializer]:
+    if len(known_type_deserializers) == 0:
+        # without custom deserializers, the deserializer of a type is generated once and shared.
+        # the repr is part of the key as equal unions may try their types in different orders
+        key = (annotated_type, repr(annotated_type))
+        try:
+            hash(key)
+        except TypeError:
+            pass
+        else:
+            return _get_default_deserializer_from_type(key)
+    return _get_deserializer_from_type(annotated_type, known_type_deserializers)
+
+
+@lru_cache(maxsize=None)
+def _get_default_deserializer_from_type(key: tuple) -> Optional[Deserializer]:
+    return _get_deserializer_from_type(key[0], {})
+
+
+def _get_deserializer_from_type(
+    annotated_type, known_type_deserializers: Dict[str, Deserializer]
 ) -> Optional[Deserializer]:
     if annotated_type in known_type_deserializers:
         return known_type_deserializers[annotated_type]
@@ -198,6 +446,8 @@ def get_deserializer_from_type(
         return deserialize_float
     if annotated_type is bool:
         return deserialize_bool
+    if annotated_type is datetime:
+        return deserialize_datetime
     if annotated_type is type(None):
         return deserialize_none
     if is_dataclass(annotated_type):
@@ -206,7 +456,8 @@ def get_deserializer_from_type(
         # is_typeddict is not supported at python 3.8 yet
         total = annotated_type.__total__
         field2deserializer = {}
-        for field, field_type in annotated_type.__annotations__.items():
+        # cached type hints also resolve the forward references in the annotations
+        for field, field_type in get_cached_type_hints(annotated_type).items():
             func = get_deserializer_from_type(field_type, known_type_deserializers)
             if func is None:
                 return None
@@ -216,17 +467,33 @@ def get_deserializer_from_type(
             # they can inject any key as the semantic of total
             return None
 
-        def deserialize_typed_dict(value):
-            if not isinstance(value, dict):
-                raise ValueError("expect dictionary but get {value}")
-            output = {}
-            for field, func in field2deserializer.items():
-                if field not in value:
-                    raise ValueError(f"expect field {field} but it's missing")
-                output[field] = field2deserializer[field](value[field])
-            return output
-
-        return deserialize_typed_dict
+        # generate straight-line code checking and deserializing each field
+        lines = [
+            "def deserialize_typed_dict(value):",
+            "    if not isinstance(value, dict):",
+            '        raise ValueError("expect dictionary but get {value}")',
+        ]
+        namespace = {}
+        items = []
+        for i, (field, func) in enumerate(field2deserializer.items()):
+            namespace[f"deser_{i}"] = func
+            msg = f"expect field {field} but it's missing"
+            lines += [
+                f"    if {field!r} not in value:",
+                f"        raise ValueError({msg!r})",
+            ]
+            items.append(f"{field!r}: deser_{i}(value[{field!r}])")
+        lines.append(f"    return {{{', '.join(items)}}}")
+
+        exec(
+            compile(
+                "\n".join(lines),
+                f"<gena.deserialize_typed_dict:{annotated_type.__name__}>",
+                "exec",
+            ),
+            namespace,
+        )
+        return namespace["deserialize_typed_dict"]
 
     args = get_args(annotated_type)
     origin = get_origin(annotated_type)
@@ -240,15 +507,31 @@ def get_deserializer_from_type(
         assert all(
             isinstance(arg, (str, int, float)) for arg in args
         ), f"Invalid literals: {args}"
-        valid_values = set(args)
+        valid_values = frozenset(args)
 
         def deserialize_literal(value):
             if value not in valid_values:
-                raise Exception(f"expect one of {valid_values} but get {value}")
+                raise ValueError(f"expect one of {set(valid_values)} but get {value}")
             return value
 
         return deserialize_literal
 
+    if origin is tuple:
+        if len(args) == 2 and args[1] is Ellipsis:
+            deserialize_item = get_deserializer_from_type(
+                args[0], known_type_deserializers
+            )
+            if deserialize_item is None:
+                return None
+            return get_deserialize_homogeneous_tuple(deserialize_item)
+
+        deserialize_items = [
+            get_deserializer_from_type(arg, known_type_deserializers) for arg in args
+        ]
+        if any(fn is None for fn in deserialize_items):
+            return None
+        return get_deserialize_tuple(deserialize_items)  # type: ignore
+
     arg_desers = [
         get_deserializer_from_type(arg, known_type_deserializers) for arg in args
     ]
@@ -264,16 +547,27 @@ def get_deserializer_from_type(
             arg_desers[i] for i, arg in enumerate(args) if arg is not type(None)
         ][0]
 
-        def deserialize_optional_arg(value):
-            if value is None:
-                return value
-            return not_none_arg_deser(value)  # type: ignore
-
-        deserialize_args = deserialize_optional_arg
+        deserialize_args = get_deserialize_optional(not_none_arg_deser)  # type: ignore
     else:
-        # TODO: we can optimize this further
+        # only try the deserializers that may accept the type of the value, the others are going
+        # to fail anyway. values of other types (e.g., subclasses) try all deserializers
+        arg_types = [
+            get_accepted_types(arg, arg_deser, known_type_deserializers)
+            for arg, arg_deser in zip(args, arg_desers)
+        ]
+        type2desers = {
+            type_: [
+                arg_deser
+                for arg_deser, types in zip(arg_desers, arg_types)
+                if types is None or type_ in types
+            ]
+            for types in arg_types
+            if types is not None
+            for type_ in types
+        }
+
         def deserialize_n_args(value):
-            for arg_deser in arg_desers:
+            for arg_deser in type2desers.get(type(value), arg_desers):
                 try:
                     return arg_deser(value)  # type: ignore
                 except ValueError:
@@ -306,7 +600,7 @@ def get_dataclass_deserializer(
     # extract deserialize for each field
     field2deserializer: Dict[str, Deserializer] = {}
     field2optional: Dict[str, bool] = {}
-    field_types = get_type_hints(CLS)
+    field_types = get_cached_type_hints(CLS)
 
     for field in fields(CLS):
         field_type = field_types[field.name]
@@ -319,20 +613,136 @@ def get_dataclass_deserializer(
             None
         ) in get_args(field_type)
 
-    def deserialize_dataclass(value):
-        if not isinstance(value, dict):
-            raise ValueError(f"expect dictionary but get {value}")
-
-        output = {}
-        for field, deserialize in field2deserializer.items():
-            if field in value:
-                output[field] = deserialize(value[field])
-            elif not field2optional[field]:
+    # generate straight-line code deserializing each field so that there is no loop over the fields
+    # when it is called
+    lines = [
+        "def deserialize_dataclass(value):",
+        "    if not isinstance(value, dict):",
+        '        raise ValueError(f"expect dictionary but get {value}")',
+    ]
+    namespace = {"CLS": CLS}
+    dataclass_fields = fields(CLS)
+    if all(
+        field.init
+        and (
+            not field2optional[field.name]
+            or field.default is not MISSING
+            or field.default_factory is not MISSING
+        )
+        for field in dataclass_fields
+    ):
+        # call the constructor with the deserialized values directly, the missing optional
+        # fields get their default values as the constructor would do
+        args = []
+        for i, field in enumerate(dataclass_fields):
+            name = field.name
+            namespace[f"deser_{i}"] = field2deserializer[name]
+            expr = f"deser_{i}(value[{name!r}])"
+            if not field2optional[name]:
                 # not optional field but missing
-                raise ValueError(f"expect the field {field} but it's missing")
-        return CLS(**output)
-
-    return deserialize_dataclass
+                msg = f"expect the field {name} but it's missing"
+                lines += [
+                    f"    if {name!r} not in value:",
+                    f"        raise ValueError({msg!r})",
+                ]
+            elif field.default is not MISSING:
+                namespace[f"default_{i}"] = field.default
+                expr = f"{expr} if {name!r} in value else default_{i}"
+            else:
+                namespace[f"default_factory_{i}"] = field.default_factory
+                expr = f"{expr} if {name!r} in value else default_factory_{i}()"
+            lines.append(f"    arg_{i} = {expr}")
+            args.append(f"{name}=arg_{i}")
+        lines.append(f"    return CLS({', '.join(args)})")
+    else:
+        lines.append("    output = {}")
+        for i, (field, func) in enumerate(field2deserializer.items()):
+            namespace[f"deser_{i}"] = func
+            lines += [
+                f"    if {field!r} in value:",
+                f"        output[{field!r}] = deser_{i}(value[{field!r}])",
+            ]
+            if not field2optional[field]:
+                # not optional field but missing
+                msg = f"expect the field {field} but it's missing"
+                lines += ["    else:", f"        raise ValueError({msg!r})"]
+        lines.append("    return CLS(**output)")
+
+    exec(
+        compile(
+            "\n".join(lines), f"<gena.deserialize_dataclass:{CLS.__name__}>", "exec"
+        ),
+        namespace,
+    )
+    return namespace["deserialize_dataclass"]
+
+
+# deserializers of the common field types
+FIELD_DESERIALIZERS = {
+    AutoField: deserialize_int,
+    BigAutoField: deserialize_int,
+    IntegerField: deserialize_int,
+    BigIntegerField: deserialize_int,
+    SmallIntegerField: deserialize_int,
+    FloatField: deserialize_float,
+    DoubleField: deserialize_float,
+    BooleanField: deserialize_bool,
+    DateTimeField: deserialize_datetime,
+}
+
+# functions wrapping the deserializer of a dataclass into the one of the container fields storing it
+DATACLASS_FIELD_WRAPPERS = {
+    ListDataClassField: get_deserialize_list,
+    DictDataClassField: get_deserialize_dict,
+    Dict2ListDataClassField: lambda func: get_deserialize_dict(
+        get_deserialize_list(func)
+    ),
+}
+
+
+# types of JSON values that are possibly accepted by the leaf deserializers
+DESERIALIZER_ACCEPTED_TYPES = {
+    deserialize_int: (int, float, str),
+    deserialize_float: (int, float, str),
+    deserialize_bool: (bool, str),
+    deserialize_str: (str,),
+    deserialize_datetime: (str, datetime),
+    deserialize_none: (type(None),),
+    deserialize_number_or_string: (int, bool, float, str),
+}
+
+
+def get_accepted_types(
+    annotated_type, deserializer: Deserializer, known_type_deserializers: dict
+) -> Optional[tuple]:
+    """Get types of JSON values that the deserializer of the annotated type possibly accepts.
+    Return None if we don't know.
+    """
+    if deserializer in DESERIALIZER_ACCEPTED_TYPES:
+        return DESERIALIZER_ACCEPTED_TYPES[deserializer]
+    if annotated_type in known_type_deserializers:
+        return None
+    if is_dataclass(annotated_type) or isinstance(annotated_type, _TypedDictMeta):
+        return (dict,)
+    origin = get_origin(annotated_type)
+    if origin is list:
+        return (list,)
+    if origin is set:
+        return (set,)
+    if origin is tuple:
+        return (list, tuple)
+    if origin is dict:
+        return (dict,)
+    if origin is Literal:
+        types = set()
+        for arg in get_args(annotated_type):
+            if isinstance(arg, str):
+                types.add(str)
+            else:
+                # numbers are compared by values, e.g., 1 == 1.0 == True
+                types.update((int, bool, float))
+        return tuple(types)
+    return None
 
 
 def deserialize_dict(value):
@@ -0,0 +1,400 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+
+import pytest
+from flask import Flask
+from gena import generate_api
+from gena.custom_fields import DataClassField, ListDataClassField
+from peewee import (
+    BooleanField,
+    CompositeKey,
+    DateTimeField,
+    FloatField,
+    IntegerField,
+    Model,
+    SqliteDatabase,
+    TextField,
+)
+
+
+@dataclass
+class Point:
+    x: int
+    y: Optional[float] = None
+
+
+@dataclass
+class Event:
+    name: str
+    at: datetime
+
+
+class Shape(Model):
+    name = TextField()
+    center = DataClassField(Point, null=True, raw_json=True)
+    points = ListDataClassField(Point, raw_json=True)
+
+
+class Note(Model):
+    title = TextField()
+    body = TextField()
+
+    def to_dict(self):
+        # the body is left out
+        return {"id": self.id, "title": self.title}
+
+
+class Todo(Model):
+    checked = BooleanField()
+    todo = TextField()
+    prio = IntegerField(default=0)
+    score = FloatField(default=0.0)
+    due = DateTimeField(null=True)
+
+
+class Stat(Model):
+    name = TextField()
+    count = IntegerField()
+
+
+MODELS = [Shape, Note, Todo, Stat]
+
+
+@pytest.fixture
+def db():
+    db = SqliteDatabase(":memory:")
+    db.bind(MODELS)
+    db.create_tables(MODELS)
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def todos(db):
+    for i in range(10):
+        Todo.create(
+            checked=i % 2 == 0,
+            todo=f"t{i}",
+            prio=i % 3,
+            score=i * 1.5,
+            due=datetime(2020, 1, i + 1, 5),
+        )
+
+
+@pytest.fixture(params=[True, False], ids=["window", "no_window"])
+def window_function(request, monkeypatch):
+    """Run the test with and without the queries using window functions"""
+    if not request.param:
+        monkeypatch.setattr(
+            "gena.api_generator.support_window_function", lambda database: False
+        )
+    return request.param
+
+
+def make_client(Model, **kwargs):
+    app = Flask(__name__)
+    app.register_blueprint(generate_api(Model, **kwargs), url_prefix="/api")
+    return app.test_client()
+
+
+def test_raw_json_same_as_other_endpoints(db):
+    Shape.create(name="a", center=Point(1, 2.5), points=[Point(3), Point(4, 1.0)])
+    Shape.create(name="b", center=None, points=[])
+    client = make_client(Shape)
+
+    items = client.get("/api/shape").get_json()["items"]
+    assert len(items) == 2
+    for item in items:
+        resp = client.get(f"/api/shape/{item['id']}")
+        assert resp.get_json() == item
+        # the fields are sent in the same order
+        assert list(resp.get_json().keys()) == list(item.keys())
+
+    items = client.get("/api/shape?fields=points,name").get_json()["items"]
+    assert items[0] == {
+        "points": [{"x": 3, "y": None}, {"x": 4, "y": 1.0}],
+        "name": "a",
+    }
+
+
+def test_raw_json_rejects_dates(db):
+    class Log(Model):
+        events = ListDataClassField(Event, raw_json=True)
+
+    with pytest.raises(ValueError):
+        generate_api(Log)
+
+
+def test_projection_skips_fields_left_out_by_custom_serializer(db):
+    Note.create(title="a", body="x")
+    Note.create(title="b", body="y")
+    client = make_client(Note)
+
+    resp = client.post("/api/note/find_by_ids?fields=body", json={"ids": [1, 2]})
+    assert resp.status_code == 200
+    assert resp.get_json() == {"items": {"1": {}, "2": {}}, "total": 2}
+
+    resp = client.post("/api/note/find_by_ids?fields=title,body", json={"ids": [1]})
+    assert resp.get_json() == {"items": {"1": {"title": "a"}}, "total": 1}
+
+    resp = client.get("/api/note?fields=title,body")
+    assert resp.get_json()["items"] == [{"title": "a"}, {"title": "b"}]
+    assert client.get("/api/note/1?fields=body").get_json() == {}
+
+
+@pytest.mark.parametrize("query", ["", "?return=minimal"])
+def test_update_ignores_id_in_body(db, query):
+    Note.create(title="a", body="x")
+    Note.create(title="b", body="y")
+    client = make_client(Note)
+
+    resp = client.put(f"/api/note/1{query}", json={"id": 2, "title": "c"})
+    assert resp.status_code == 200
+    assert resp.get_json()["id"] == 1
+    assert [(n.id, n.title) for n in Note.select().order_by(Note.id)] == [
+        (1, "c"),
+        (2, "b"),
+    ]
+
+
+def test_generate_api_without_id_field(db):
+    class Country(Model):
+        code = TextField(primary_key=True)
+        name = TextField()
+
+    class Edge(Model):
+        source = IntegerField()
+        target = IntegerField()
+
+        class Meta:
+            primary_key = CompositeKey("source", "target")
+
+    generate_api(Country)
+    generate_api(Edge)
+
+
+def test_list(todos, window_function):
+    client = make_client(Todo)
+
+    resp = client.get("/api/todo")
+    assert resp.status_code == 200
+    result = resp.get_json()
+    assert result["total"] == 10
+    assert [item["todo"] for item in result["items"]] == [f"t{i}" for i in range(10)]
+    assert result["items"][0] == {
+        "id": 1,
+        "checked": True,
+        "todo": "t0",
+        "prio": 0,
+        "score": 0.0,
+        "due": "Wed, 01 Jan 2020 05:00:00 GMT",
+    }
+
+    # the total is counted when the page is full, and known without counting otherwise
+    for query, n_items, total in [
+        ("limit=3", 3, 10),
+        ("limit=3&offset=9", 1, 10),
+        ("limit=3&offset=50", 0, 10),
+        ("limit=0", 0, 10),
+        ("prio=1", 3, 3),
+        ("prio=1&limit=3", 3, 3),
+        ("prio[gte]=1&checked=true", 3, 3),
+        ("prio[in]=0,2", 7, 7),
+        ("todo[in]=t0,t1", 2, 2),
+        ("due[gt]=2020-01-05T05:00:00", 5, 5),
+    ]:
+        result = client.get(f"/api/todo?{query}").get_json()
+        assert (len(result["items"]), result["total"]) == (n_items, total), query
+
+    result = client.get("/api/todo?count=false&limit=2").get_json()
+    assert result["total"] is None and len(result["items"]) == 2
+
+    result = client.get("/api/todo?fields=todo,prio&sorted_by=-prio,todo&limit=2")
+    assert result.get_json() == {
+        "items": [{"todo": "t2", "prio": 2}, {"todo": "t5", "prio": 2}],
+        "total": 10,
+    }
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "foo=1",
+        "prio[xx]=1",
+        "prio[]=1",
+        "prio[gt=1",
+        "sorted_by=zz",
+        "fields=zz",
+        "prio=x",
+        "prio[in]=1,x",
+        "due[gt]=yesterday",
+        "limit=abc",
+        "limit=-1",
+        "offset=x",
+    ],
+)
+def test_list_bad_requests(todos, query):
+    assert make_client(Todo).get(f"/api/todo?{query}").status_code == 400
+
+
+def test_list_max(todos, window_function):
+    Todo.create(checked=True, todo="x", prio=1, score=0.5)
+    client = make_client(Todo)
+
+    result = client.get("/api/todo?score[max]=prio&sorted_by=prio").get_json()
+    assert [(item["prio"], item["score"]) for item in result["items"]] == [
+        (0, 13.5),
+        (1, 10.5),
+        (2, 12.0),
+    ]
+    assert result["total"] == 3
+
+    result = client.get("/api/todo?score[max]=prio&sorted_by=prio&limit=1&offset=1")
+    assert result.get_json() == {
+        "items": [
+            {
+                "id": 8,
+                "checked": False,
+                "todo": "t7",
+                "prio": 1,
+                "score": 10.5,
+                "due": "Wed, 08 Jan 2020 05:00:00 GMT",
+            }
+        ],
+        "total": 3,
+    }
+    result = client.get("/api/todo?score[max]=checked,prio").get_json()
+    assert result["total"] == 6 and len(result["items"]) == 6
+
+
+def test_list_reports_serializer_errors(todos):
+    def serialize(record):
+        if record.id == 5:
+            raise ValueError("cannot serialize")
+        return {"id": record.id}
+
+    client = make_client(Todo, serialize=serialize)
+    assert client.get("/api/todo?limit=3").status_code == 200
+    assert client.get("/api/todo").status_code == 500
+
+
+def test_list_with_count_field(db):
+    for i in range(5):
+        Stat.create(name=f"s{i}", count=i % 2)
+    client = make_client(Stat)
+
+    result = client.get("/api/stat?count=1").get_json()
+    assert result["total"] == 2
+    assert all(item["count"] == 1 for item in result["items"])
+
+
+def test_list_cache(todos):
+    client = make_client(Todo, cache_ttl=60)
+
+    resp = client.get("/api/todo?limit=1")
+    assert resp.headers["Cache-Control"] == "private, no-cache"
+    assert resp.get_json()["total"] == 10
+
+    # modified outside of the API, the cached response is returned
+    Todo.create(checked=True, todo="x")
+    assert client.get("/api/todo?limit=1").get_json()["total"] == 10
+    # modified through the API, the cache is cleared
+    client.post("/api/todo", json={"checked": True, "todo": "y"})
+    assert client.get("/api/todo?limit=1").get_json()["total"] == 12
+
+
+def test_find_by_ids(todos):
+    client = make_client(Todo)
+
+    result = client.post("/api/todo/find_by_ids", json={"ids": [1, 2, 99]})
+    result = result.get_json()
+    assert result["total"] == 2
+    assert [item["todo"] for item in result["items"]] == ["t0", "t1"]
+
+    result = client.post("/api/todo/find_by_ids?fields=todo,prio", json={"ids": [1]})
+    assert result.get_json() == {"items": {"1": {"todo": "t0", "prio": 0}}, "total": 1}
+
+
+def test_get_one_etag(todos):
+    client = make_client(Todo)
+
+    resp = client.get("/api/todo/1")
+    assert resp.status_code == 200 and resp.get_json()["todo"] == "t0"
+    etag = resp.headers["ETag"]
+
+    resp = client.get("/api/todo/1", headers={"If-None-Match": etag})
+    assert resp.status_code == 304 and resp.data == b""
+    # the tag depends on the selected fields
+    resp = client.get("/api/todo/1?fields=todo", headers={"If-None-Match": etag})
+    assert resp.status_code == 200 and resp.get_json() == {"todo": "t0"}
+
+    client.put("/api/todo/1", json={"todo": "a"})
+    resp = client.get("/api/todo/1", headers={"If-None-Match": etag})
+    assert resp.status_code == 200 and resp.get_json()["todo"] == "a"
+    etag = resp.headers["ETag"]
+
+    client.put("/api/todo/1?return=minimal", json={"todo": "b"})
+    resp = client.get("/api/todo/1", headers={"If-None-Match": etag})
+    assert resp.status_code == 200 and resp.get_json()["todo"] == "b"
+
+    assert client.get("/api/todo/100").status_code == 404
+    assert client.head("/api/todo/1").status_code == 200
+    assert client.head("/api/todo/100").status_code == 404
+
+
+def test_create_and_upsert(todos):
+    client = make_client(Todo)
+
+    resp = client.post("/api/todo", json={"id": 5, "checked": True, "todo": "new"})
+    assert resp.status_code == 200 and resp.get_json()["id"] == 11
+
+    resp = client.post("/api/todo?upsert=true", json={"todo": "t1", "prio": 1})
+    assert resp.status_code == 200 and resp.get_json()["id"] == 2
+    resp = client.post("/api/todo?upsert=true", json={"checked": True, "todo": "t1"})
+    assert resp.status_code == 200 and resp.get_json()["id"] == 12
+    assert Todo.select().count() == 12
+
+    for body in [{}, {"unknown": 1}]:
+        assert client.post("/api/todo?upsert=true", json=body).status_code == 400
+    assert client.post("/api/todo", json={"checked": 1, "todo": "x"}).status_code == 400
+    assert Todo.select().count() == 12
+
+
+def test_update(todos):
+    client = make_client(Todo)
+
+    # records fetched from the API can be sent back as they are
+    record = client.get("/api/todo/2").get_json()
+    record["todo"] = "updated"
+    resp = client.put("/api/todo/2", json=record)
+    assert resp.status_code == 200 and resp.get_json() == record
+    assert Todo.get_by_id(2).due == datetime(2020, 1, 2, 5)
+
+    resp = client.put("/api/todo/3?return=minimal", json={"todo": "minimal"})
+    assert resp.status_code == 200 and resp.get_json() == {"id": 3}
+    assert Todo.get_by_id(3).todo == "minimal"
+    assert client.put("/api/todo/3?return=minimal", json={}).get_json() == {"id": 3}
+
+    for url in [
+        "/api/todo/100",
+        "/api/todo/100?return=minimal",
+        "/api/todo/x?return=minimal",
+    ]:
+        assert client.put(url, json={"todo": "x"}).status_code == 404
+    assert client.put("/api/todo/3", json={"due": "yesterday"}).status_code == 400
+
+    client.put("/api/todo/3", json={"due": "2020-01-01T05:00:00+05:00"})
+    assert Todo.get_by_id(3).due == datetime(2020, 1, 1)
+
+
+def test_delete(todos):
+    client = make_client(Todo)
+
+    assert client.delete("/api/todo/1").status_code == 200
+    assert client.delete("/api/todo/1").status_code == 404
+    assert client.delete("/api/todo").status_code == 405
+
+    client = make_client(Todo, enable_truncate_table=True)
+    assert client.delete("/api/todo").status_code == 200
+    assert Todo.select().count() == 0
@@ -0,0 +1,152 @@
+import threading
+
+import pytest
+from gena.cache import TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("gena.cache.time.monotonic", clock)
+    return clock
+
+
+def counter():
+    calls = []
+
+    def compute():
+        calls.append(None)
+        return len(calls)
+
+    return compute, calls
+
+
+def test_expiry(clock):
+    cache = TTLCache(ttl=10)
+    compute, calls = counter()
+
+    assert cache.get_or_compute("a", compute) == 1
+    clock.now = 9.9
+    assert cache.get_or_compute("a", compute) == 1
+    clock.now = 10.0
+    assert cache.get_or_compute("a", compute) == 2
+    assert len(calls) == 2
+
+
+def test_clear(clock):
+    cache = TTLCache(ttl=10)
+    compute, calls = counter()
+
+    assert cache.get_or_compute("a", compute) == 1
+    assert cache.get_or_compute("b", compute) == 2
+    cache.clear()
+    assert cache.get_or_compute("a", compute) == 3
+    assert cache.get_or_compute("b", compute) == 4
+
+
+def test_clear_during_compute_discards_value(clock):
+    cache = TTLCache(ttl=10)
+
+    def compute():
+        # the records are modified while the value is computed
+        cache.clear()
+        return "stale"
+
+    assert cache.get_or_compute("a", compute) == "stale"
+    assert cache.get_or_compute("a", lambda: "fresh") == "fresh"
+
+
+def test_failed_compute_is_not_cached(clock):
+    cache = TTLCache(ttl=10)
+
+    def compute():
+        raise ValueError("failed")
+
+    with pytest.raises(ValueError):
+        cache.get_or_compute("a", compute)
+    assert cache.inflight == {}
+    assert cache.get_or_compute("a", lambda: 1) == 1
+
+
+def test_maxsize(clock):
+    cache = TTLCache(ttl=10, maxsize=2)
+    cache.get_or_compute("a", lambda: 1)
+    clock.now = 1
+    cache.get_or_compute("b", lambda: 2)
+    clock.now = 2
+    cache.get_or_compute("c", lambda: 3)
+
+    assert list(cache.entries) == ["b", "c"]
+
+
+def test_concurrent_misses_compute_once():
+    cache = TTLCache(ttl=60)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(None)
+        started.set()
+        release.wait(timeout=10)
+        return "value"
+
+    results = []
+
+    def worker():
+        results.append(cache.get_or_compute("a", compute))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    threads[0].start()
+    assert started.wait(timeout=10)
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert len(calls) == 1
+    assert results == ["value"] * 8
+
+
+def test_concurrent_misses_after_failure():
+    cache = TTLCache(ttl=60)
+    started = threading.Event()
+    release = threading.Event()
+
+    def failed_compute():
+        started.set()
+        release.wait(timeout=10)
+        raise ValueError("failed")
+
+    errors = []
+
+    def failed_worker():
+        try:
+            cache.get_or_compute("a", failed_compute)
+        except ValueError as e:
+            errors.append(e)
+
+    results = []
+    failed = threading.Thread(target=failed_worker)
+    failed.start()
+    assert started.wait(timeout=10)
+    # the waiting thread computes the value itself when the other computation fails
+    waiting = threading.Thread(
+        target=lambda: results.append(cache.get_or_compute("a", lambda: "value"))
+    )
+    waiting.start()
+    release.set()
+    failed.join(timeout=10)
+    waiting.join(timeout=10)
+
+    assert len(errors) == 1
+    assert results == ["value"]
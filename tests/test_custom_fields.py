@@ -0,0 +1,72 @@
+from dataclasses import dataclass
+
+import pytest
+from gena.custom_fields import (
+    DataClassField,
+    ListDataClassField,
+    migrate_dataclass_fields,
+)
+from peewee import Model, SqliteDatabase, TextField
+
+
+@dataclass
+class Point:
+    x: int
+    y: int
+
+
+@dataclass
+class Pair:
+    a: int
+    b: int
+
+    @staticmethod
+    def from_tuple(value):
+        return Pair(*value)
+
+
+def test_columnar_round_trip():
+    field = ListDataClassField(Point, columnar=True)
+    value = [Point(1, 2), Point(3, 4)]
+    assert field.python_value(field.db_value(value)) == value
+    assert field.python_value(field.db_value([])) == []
+
+
+def test_columnar_rejects_incompatible_options():
+    with pytest.raises(ValueError):
+        ListDataClassField(Point, columnar=True, raw_json=True)
+    with pytest.raises(ValueError):
+        ListDataClassField(Pair, columnar=True)
+
+
+def test_migrate_dataclass_fields():
+    class Shape(Model):
+        name = TextField()
+        center = DataClassField(Point, null=True)
+        points = ListDataClassField(Point)
+
+    db = SqliteDatabase(":memory:")
+    db.bind([Shape])
+    db.create_tables([Shape])
+    # rows written by the previous versions store the dataclasses as arrays
+    for name, center, points in [
+        ("a", b"[1,2]", b"[[3,4]]"),
+        ("b", None, b"[]"),
+        ("c", b"[5,6]", b"[[7,8],[9,10]]"),
+    ]:
+        db.execute_sql(
+            "INSERT INTO shape (name, center, points) VALUES (?, ?, ?)",
+            (name, center, points),
+        )
+    assert Shape.select().where(Shape.center == Point(1, 2)).count() == 0
+
+    migrate_dataclass_fields(Shape, batch_size=2)
+
+    rows = db.execute_sql("SELECT center, points FROM shape ORDER BY id").fetchall()
+    assert [(row[0] and bytes(row[0]), bytes(row[1])) for row in rows] == [
+        (b'{"x":1,"y":2}', b'[{"x":3,"y":4}]'),
+        (None, b"[]"),
+        (b'{"x":5,"y":6}', b'[{"x":7,"y":8},{"x":9,"y":10}]'),
+    ]
+    assert Shape.select().where(Shape.center == Point(1, 2)).count() == 1
+    assert Shape.get_by_id(3).points == [Point(7, 8), Point(9, 10)]
@@ -0,0 +1,86 @@
+from dataclasses import dataclass
+from typing import Dict, List, Literal, Optional, TypedDict, Union
+
+import pytest
+from gena.deserializer import (
+    deserialize_datetime,
+    get_cached_type_hints,
+    get_dataclass_deserializer,
+    get_deserializer_from_type,
+)
+
+
+@dataclass
+class Point:
+    x: int
+    y: Optional[float] = None
+
+
+@dataclass
+class Point3D(Point):
+    z: float = 0.0
+
+
+@dataclass
+class Tree:
+    name: str
+    children: "List[Tree]"
+
+
+class Item(TypedDict):
+    id: int
+    tags: List[str]
+
+
+def test_type_hints_merge_bases():
+    assert get_cached_type_hints(Point3D) == {
+        "x": int,
+        "y": Optional[float],
+        "z": float,
+    }
+
+
+def test_type_hints_resolve_forward_references():
+    assert get_cached_type_hints(Tree) == {"name": str, "children": List[Tree]}
+
+
+def test_dataclass_deserializer():
+    deserialize = get_dataclass_deserializer(Point3D, {})
+    assert deserialize({"x": 1, "z": 2.5}) == Point3D(1, None, 2.5)
+    with pytest.raises(ValueError):
+        deserialize({"y": 1.0})
+    with pytest.raises(ValueError):
+        deserialize({"x": "a"})
+
+
+def test_typed_dict_deserializer():
+    deserialize = get_deserializer_from_type(Item, {})
+    assert deserialize({"id": 1, "tags": ["a"]}) == {"id": 1, "tags": ["a"]}
+    with pytest.raises(ValueError):
+        deserialize({"id": 1})
+
+
+def test_container_deserializers():
+    deserialize = get_deserializer_from_type(Dict[str, List[int]], {})
+    assert deserialize({"a": [1, "2"]}) == {"a": [1, 2]}
+    deserialize = get_deserializer_from_type(Literal["a", "b"], {})
+    assert deserialize("a") == "a"
+    with pytest.raises(ValueError):
+        deserialize("c")
+
+
+def test_union_deserializer_keeps_order():
+    assert get_deserializer_from_type(Union[int, str], {})("1") == 1
+    assert get_deserializer_from_type(Union[str, int], {})("1") == "1"
+    assert get_deserializer_from_type(Union[int, str, List[int]], {})([1]) == [1]
+
+
+def test_deserialize_datetime():
+    assert deserialize_datetime("2020-01-01T05:00:00+05:00").isoformat() == (
+        "2020-01-01T00:00:00"
+    )
+    assert deserialize_datetime("Wed, 01 Jan 2020 05:00:00 GMT").isoformat() == (
+        "2020-01-01T05:00:00"
+    )
+    with pytest.raises(ValueError):
+        deserialize_datetime("yesterday")